@@ -2,7 +2,6 @@ __author__ = 'Brandon C. Kelly'
 
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.linalg import solve
 from scipy.optimize import minimize
 import samplers
 import multiprocessing
@@ -333,64 +332,19 @@ class CarmaSample(samplers.MCMCSample):
         """
         self.mle = {'loglik': -MLE.fun, 'var': MLE.x[0] ** 2, 'measerr_scale': MLE.x[1], 'mu': MLE.x[2]}
 
-        # add AR polynomial roots and PSD lorentzian parameters
-        quad_coefs = np.exp(MLE.x[3:self.p + 3])
-        ar_roots = np.zeros(self.p, dtype=complex)
-        psd_width = np.zeros(self.p)
-        psd_cent = np.zeros(self.p)
-
-        for i in xrange(self.p / 2):
-            quad1 = quad_coefs[2 * i]
-            quad2 = quad_coefs[2 * i + 1]
-
-            discriminant = quad2 ** 2 - 4.0 * quad1
-            if discriminant > 0:
-                sqrt_disc = np.sqrt(discriminant)
-            else:
-                sqrt_disc = 1j * np.sqrt(np.abs(discriminant))
-
-            ar_roots[2 * i] = -0.5 * (quad2 + sqrt_disc)
-            ar_roots[2 * i + 1] = -0.5 * (quad2 - sqrt_disc)
-            psd_width[2 * i] = -np.real(ar_roots[2 * i]) / (2.0 * np.pi)
-            psd_cent[2 * i] = np.abs(np.imag(ar_roots[2 * i])) / (2.0 * np.pi)
-            psd_width[2 * i + 1] = -np.real(ar_roots[2 * i + 1]) / (2.0 * np.pi)
-            psd_cent[2 * i + 1] = np.abs(np.imag(ar_roots[2 * i + 1])) / (2.0 * np.pi)
-
-        if self.p % 2 == 1:
-            # p is odd, so add in root from linear term
-            ar_roots[-1] = -quad_coefs[-1]
-            psd_cent[-1] = 0.0
-            psd_width[-1] = quad_coefs[-1] / (2.0 * np.pi)
-
+        # add AR polynomial roots and PSD lorentzian parameters, computed in the same way as for the MCMC samples
+        ar_roots = _roots_from_quad_coefs(np.exp(MLE.x[np.newaxis, 3:self.p + 3]))[0]
         self.mle['ar_roots'] = ar_roots
-        self.mle['psd_width'] = psd_width
-        self.mle['psd_cent'] = psd_cent
-        self.mle['ar_coefs'] = np.poly(ar_roots).real
+        self.mle['psd_width'] = -ar_roots.real / (2.0 * np.pi)
+        self.mle['psd_cent'] = np.abs(ar_roots.imag) / (2.0 * np.pi)
+        self.mle['ar_coefs'] = _poly_from_roots(ar_roots[np.newaxis, :])[0].real
 
         # now calculate the moving average coefficients
         if self.q == 0:
             self.mle['ma_coefs'] = 1.0
         else:
-            quad_coefs = np.exp(MLE.x[3 + self.p:])
-            ma_roots = np.empty(quad_coefs.size, dtype=complex)
-            for i in xrange(self.q / 2):
-                quad1 = quad_coefs[2 * i]
-                quad2 = quad_coefs[2 * i + 1]
-
-                discriminant = quad2 ** 2 - 4.0 * quad1
-                if discriminant > 0:
-                    sqrt_disc = np.sqrt(discriminant)
-                else:
-                    sqrt_disc = 1j * np.sqrt(np.abs(discriminant))
-
-                ma_roots[2 * i] = -0.5 * (quad2 + sqrt_disc)
-                ma_roots[2 * i + 1] = -0.5 * (quad2 - sqrt_disc)
-
-            if self.q % 2 == 1:
-                # q is odd, so add in root from linear term
-                ma_roots[-1] = -quad_coefs[-1]
-
-            ma_coefs = np.poly(ma_roots)
+            ma_roots = _roots_from_quad_coefs(np.exp(MLE.x[np.newaxis, 3 + self.p:]))
+            ma_coefs = _poly_from_roots(ma_roots)[0]
             # normalize so constant in polynomial is unity, and reverse order to be consistent with MA
             # representation
             self.mle['ma_coefs'] = np.real(ma_coefs / ma_coefs[self.q])[::-1]
@@ -418,8 +372,9 @@ class CarmaSample(samplers.MCMCSample):
             idx = 0
             # Parameters are not already in the dictionary, add them.
             self._samples['var'] = (trace[:, 0] ** 2)     # Variance of the CAR(p) process
-            self._samples['measerr_scale'] = trace[:, 1]  # Measurement errors are scaled by this much.
-            self._samples['mu'] = trace[:, 2]             # model mean of time series
+            # Store contiguous copies of the trace columns, so that scans over the MCMC samples have unit stride.
+            self._samples['measerr_scale'] = np.ascontiguousarray(trace[:, 1])  # Measurement error scale factor
+            self._samples['mu'] = np.ascontiguousarray(trace[:, 2])  # model mean of time series
             # AR(p) polynomial is factored as a product of quadratic terms:
             #   alpha(s) = (quad_coefs[0] + quad_coefs[1] * s + s ** 2) * ...
             self._samples['quad_coefs'] = np.exp(trace[:, 3:self.p + 3])
@@ -440,32 +395,12 @@ class CarmaSample(samplers.MCMCSample):
         """
         Calculate the roots of the CARMA(p,q) characteristic polynomial and add them to the MCMC samples.
         """
-        var = self._samples['var']
-        quad_coefs = self._samples['quad_coefs']
-        self._samples['ar_roots'] = np.empty((var.size, self.p), dtype=complex)
-        self._samples['psd_centroid'] = np.empty((var.size, self.p))
-        self._samples['psd_width'] = np.empty((var.size, self.p))
-
-        for i in xrange(self.p / 2):
-            quad1 = quad_coefs[:, 2 * i]
-            quad2 = quad_coefs[:, 2 * i + 1]
-
-            discriminant = quad2 ** 2 - 4.0 * quad1
-            sqrt_disc = np.where(discriminant > 0, np.sqrt(discriminant), 1j * np.sqrt(np.abs(discriminant)))
-            self._samples['ar_roots'][:, 2 * i] = -0.5 * (quad2 + sqrt_disc)
-            self._samples['ar_roots'][:, 2 * i + 1] = -0.5 * (quad2 - sqrt_disc)
-            self._samples['psd_width'][:, 2 * i] = -np.real(self._samples['ar_roots'][:, 2 * i]) / (2.0 * np.pi)
-            self._samples['psd_centroid'][:, 2 * i] = np.abs(np.imag(self._samples['ar_roots'][:, 2 * i])) / \
-                (2.0 * np.pi)
-            self._samples['psd_width'][:, 2 * i + 1] = -np.real(self._samples['ar_roots'][:, 2 * i + 1]) / (2.0 * np.pi)
-            self._samples['psd_centroid'][:, 2 * i + 1] = np.abs(np.imag(self._samples['ar_roots'][:, 2 * i + 1])) / \
-                (2.0 * np.pi)
-
-        if self.p % 2 == 1:
-            # p is odd, so add in root from linear term
-            self._samples['ar_roots'][:, -1] = -quad_coefs[:, -1]
-            self._samples['psd_centroid'][:, -1] = 0.0
-            self._samples['psd_width'][:, -1] = quad_coefs[:, -1] / (2.0 * np.pi)
+        ar_roots = _roots_from_quad_coefs(self._samples['quad_coefs'])
+        self._samples['ar_roots'] = ar_roots
+        # the PSD lorentzian parameters follow directly from the roots. note that the root from the linear term is
+        # real, so its centroid is automatically zero.
+        self._samples['psd_width'] = -ar_roots.real / (2.0 * np.pi)
+        self._samples['psd_centroid'] = np.abs(ar_roots.imag) / (2.0 * np.pi)
 
     def _ma_coefs(self, trace):
         """
@@ -475,40 +410,23 @@ class CarmaSample(samplers.MCMCSample):
         if self.q == 0:
             self._samples['ma_coefs'] = np.ones((nsamples, 1))
         else:
-            quad_coefs = np.exp(trace[:, 3 + self.p:])
-            roots = np.empty(quad_coefs.shape, dtype=complex)
-            for i in xrange(self.q / 2):
-                quad1 = quad_coefs[:, 2 * i]
-                quad2 = quad_coefs[:, 2 * i + 1]
-
-                discriminant = quad2 ** 2 - 4.0 * quad1
-                sqrt_disc = np.where(discriminant > 0, np.sqrt(discriminant), 1j * np.sqrt(np.abs(discriminant)))
-                roots[:, 2 * i] = -0.5 * (quad2 + sqrt_disc)
-                roots[:, 2 * i + 1] = -0.5 * (quad2 - sqrt_disc)
-
-            if self.q % 2 == 1:
-                # q is odd, so add in root from linear term
-                roots[:, -1] = -quad_coefs[:, -1]
-
-            coefs = np.empty((nsamples, self.q + 1), dtype=complex)
-            for i in xrange(nsamples):
-                coefs_i = np.poly(roots[i, :])
-                # normalize so constant in polynomial is unity, and reverse order to be consistent with MA
-                # representation
-                coefs[i, :] = (coefs_i / coefs_i[self.q])[::-1]
-
-            self._samples['ma_coefs'] = coefs.real
+            roots = _roots_from_quad_coefs(np.exp(trace[:, 3 + self.p:]))
+            coefs = _poly_from_roots(roots)
+            # normalize so constant in polynomial is unity, and reverse order to be consistent with MA representation
+            coefs = (coefs / coefs[:, self.q:self.q + 1])[:, ::-1]
+
+            # the real part of a complex array is a strided view, so store a contiguous copy
+            self._samples['ma_coefs'] = np.ascontiguousarray(coefs.real)
 
     def _ar_coefs(self):
         """
         Calculate the CARMA(p,q) autoregressive coefficients and add them to the MCMC samples.
         """
-        roots = self._samples['ar_roots']
-        coefs = np.empty((roots.shape[0], self.p + 1), dtype=complex)
-        for i in xrange(roots.shape[0]):
-            coefs[i, :] = np.poly(roots[i, :])
+        coefs = _poly_from_roots(self._samples['ar_roots'])
 
-        self._samples['ar_coefs'] = coefs.real
+        # the real part of a complex array is a strided view, so store a contiguous copy. the AR coefficients are read
+        # sample by sample when computing the PSD.
+        self._samples['ar_coefs'] = np.ascontiguousarray(coefs.real)
 
     def _sigma_noise(self):
         """
@@ -527,16 +445,20 @@ class CarmaSample(samplers.MCMCSample):
         # calculate the variance of a CAR(p) process, assuming sigma = 1.0
         sigma1_variance = np.zeros_like(var) + 0j
         for k in xrange(self.p):
-            denom = -2.0 * ar_roots[:, k].real + 0j
+            root = ar_roots[:, k]
+            denom = -2.0 * root.real + 0j
             for l in xrange(self.p):
                 if l != k:
-                    denom *= (ar_roots[:, l] - ar_roots[:, k]) * (np.conjugate(ar_roots[:, l]) + ar_roots[:, k])
+                    denom *= (ar_roots[:, l] - root) * (np.conjugate(ar_roots[:, l]) + root)
 
-            ma_sum1 = np.zeros_like(ar_roots[:, 0])
+            # evaluate the MA polynomial at the root and its negative using Horner's method
+            ma_sum1 = ma_coefs[:, -1] + 0j
             ma_sum2 = ma_sum1.copy()
-            for l in xrange(ma_coefs.shape[1]):
-                ma_sum1 += ma_coefs[:, l] * ar_roots[:, k] ** l
-                ma_sum2 += ma_coefs[:, l] * (-1.0 * ar_roots[:, k]) ** l
+            for l in xrange(ma_coefs.shape[1] - 2, -1, -1):
+                ma_sum1 *= root
+                ma_sum1 += ma_coefs[:, l]
+                ma_sum2 *= -root
+                ma_sum2 += ma_coefs[:, l]
             numer = ma_sum1 * ma_sum2
             sigma1_variance += numer / denom
 
@@ -578,9 +500,14 @@ class CarmaSample(samplers.MCMCSample):
 
             nsamples0 = sigmas.shape[0]
             index = np.arange(nsamples) * (nsamples0 / nsamples)
-            sigmas = sigmas[index]
-            ar_coefs = ar_coefs[index]
-            ma_coefs = ma_coefs[index]
+            # np.take copies the thinned samples into contiguous arrays for the PSD calculation below
+            sigmas = np.take(sigmas, index, axis=0)
+            ar_coefs = np.take(ar_coefs, index, axis=0)
+            ma_coefs = np.take(ma_coefs, index, axis=0)
+
+        # The MCMC sampler repeats the current draw whenever a proposal is rejected, so many of the samples are usually
+        # duplicates. Only compute the PSD for the unique draws, and weight each one by the number of times it occurs.
+        (sigmas, ar_coefs, ma_coefs), counts = _unique_draws(sigmas, ar_coefs, ma_coefs)
 
         nfreq = 1000
         dt_min = self.time[1:] - self.time[0:self.time.size - 1]
@@ -599,29 +526,27 @@ class CarmaSample(samplers.MCMCSample):
         lower = (100.0 - percentile) / 2.0  # lower and upper intervals for credible region
         upper = 100.0 - lower
 
-        # Compute the PSDs from the MCMC samples
+        # Compute the PSDs from the MCMC samples. The polynomials are evaluated on a (nfreq, nsamples) grid as the
+        # product of the Vandermonde matrix of omega with the matrix of coefficients, a single matrix multiply.
         omega = 2.0 * np.pi * 1j * frequencies
-        ar_poly = np.zeros((nfreq, nsamples), dtype=complex)
-        ma_poly = np.zeros_like(ar_poly)
-        for k in xrange(self.p):
-            # Here we compute:
-            #   alpha(omega) = ar_coefs[0] * omega^p + ar_coefs[1] * omega^(p-1) + ... + ar_coefs[p]
-            # Note that ar_coefs[0] = 1.0.
-            argrid, omgrid = np.meshgrid(ar_coefs[:, k], omega)
-            ar_poly += argrid * (omgrid ** (self.p - k))
-        ar_poly += ar_coefs[:, self.p]
-        for k in xrange(ma_coefs.shape[1]):
-            # Here we compute:
-            #   delta(omega) = ma_coefs[0] + ma_coefs[1] * omega + ... + ma_coefs[q] * omega^q
-            magrid, omgrid = np.meshgrid(ma_coefs[:, k], omega)
-            ma_poly += magrid * (omgrid ** k)
-
-        psd_samples = np.squeeze(sigmas) ** 2 * np.abs(ma_poly) ** 2 / np.abs(ar_poly) ** 2
-
-        # Now compute credibility interval for power spectrum
-        psd_credint[:, 0] = np.percentile(psd_samples, lower, axis=1)
-        psd_credint[:, 2] = np.percentile(psd_samples, upper, axis=1)
-        psd_credint[:, 1] = np.median(psd_samples, axis=1)
+        # Here we compute:
+        #   alpha(omega) = ar_coefs[0] * omega^p + ar_coefs[1] * omega^(p-1) + ... + ar_coefs[p]
+        # Note that ar_coefs[0] = 1.0.
+        ar_poly = np.vander(omega, self.p + 1).dot(ar_coefs.T)
+        # Here we compute:
+        #   delta(omega) = ma_coefs[0] + ma_coefs[1] * omega + ... + ma_coefs[q] * omega^q
+        ma_poly = np.vander(omega, ma_coefs.shape[1]).dot(ma_coefs[:, ::-1].T)
+
+        # compute the squared moduli as real^2 + imag^2, which avoids the square root taken by np.abs()
+        ar_abs2 = np.square(ar_poly.real)
+        ar_abs2 += np.square(ar_poly.imag)
+        ma_abs2 = np.square(ma_poly.real)
+        ma_abs2 += np.square(ma_poly.imag)
+
+        psd_samples = np.squeeze(sigmas) ** 2 * ma_abs2 / ar_abs2
+
+        # Now compute credibility interval for power spectrum, getting all three percentiles in one pass
+        psd_credint[:] = _weighted_percentile(psd_samples, counts, [lower, 50.0, upper]).T
 
         # Plot the power spectra
         if sp == None:
@@ -854,6 +779,114 @@ class CarmaSample(samplers.MCMCSample):
         return dic
 
 
+def _roots_from_quad_coefs(quad_coefs):
+    """
+    Return the roots of the polynomials parameterized by their quadratic terms, for all of the MCMC samples at once. The
+    polynomial is factored into order / 2 quadratic terms, and an additional linear term if the order is odd.
+
+    :param quad_coefs: The coefficients of the quadratic terms, an array with shape (nsamples, order). The columns
+        alternate between the constant and linear coefficients of each quadratic term, and the last column is the
+        constant of the linear term when the order is odd.
+    :rtype : The complex roots, an array with shape (nsamples, order).
+    """
+    order = quad_coefs.shape[1]
+    roots = np.empty(quad_coefs.shape, dtype=complex)
+
+    # compute the roots of all of the quadratic terms at once
+    npairs = 2 * (order / 2)
+    quad1 = quad_coefs[:, 0:npairs:2]
+    quad2 = quad_coefs[:, 1:npairs:2]
+    discriminant = quad2 ** 2 - 4.0 * quad1
+    # complex square root handles negative discriminants, i.e., sqrt(disc) = 1j * sqrt(|disc|) for disc < 0
+    sqrt_disc = np.sqrt(discriminant + 0j)
+    roots[:, 0:npairs:2] = -0.5 * (quad2 + sqrt_disc)
+    roots[:, 1:npairs:2] = -0.5 * (quad2 - sqrt_disc)
+
+    if order % 2 == 1:
+        # order is odd, so add in root from linear term
+        roots[:, -1] = -quad_coefs[:, -1]
+
+    return roots
+
+
+def _poly_from_roots(roots):
+    """
+    Return the coefficients of the polynomials with the input roots, for all of the MCMC samples at once. This gives
+    the same result as calling np.poly(roots[i, :]) for each sample i, but the work is done on the whole sample axis.
+
+    :param roots: The polynomial roots, an array with shape (nsamples, order).
+    :rtype : The complex polynomial coefficients, ordered from the highest power to the constant term, an array with
+        shape (nsamples, order + 1).
+    """
+    order = roots.shape[1]
+    coefs = np.zeros((roots.shape[0], order + 1), dtype=complex)
+    coefs[:, 0] = 1.0
+    # expand the polynomial prod_k (s - roots[k]), multiplying in one root at a time
+    for k in xrange(order):
+        coefs[:, 1:k + 2] -= roots[:, k:k + 1] * coefs[:, 0:k + 1]
+
+    return coefs
+
+
+def _unique_draws(*samples):
+    """
+    Find the unique draws in a set of MCMC sample arrays. A draw is the same only if it is the same for all of the input
+    arrays.
+
+    :param samples: The arrays of MCMC samples, all with the same number of rows.
+    :rtype : A tuple containing a list of the input arrays restricted to the unique draws, and the number of times each
+        unique draw occurs.
+    """
+    nsamples = samples[0].shape[0]
+    params = np.column_stack([sample.reshape(nsamples, -1) for sample in samples])
+    # sort the draws so that duplicates are adjacent, and find where each new draw starts
+    order = np.lexsort(params.T[::-1])
+    params = params[order]
+    is_new = np.ones(nsamples, dtype=bool)
+    is_new[1:] = np.any(params[1:] != params[:-1], axis=1)
+    first = np.flatnonzero(is_new)
+    counts = np.diff(np.append(first, nsamples))
+
+    unique_samples = [np.take(sample, order[first], axis=0) for sample in samples]
+
+    return unique_samples, counts
+
+
+def _weighted_percentile(values, counts, percentiles):
+    """
+    Compute percentiles along the second axis of values, where the value in column j occurs counts[j] times. This gives
+    the same result as calling np.percentile on the array with the repeated values expanded out.
+
+    :param values: A 2-d array of values.
+    :param counts: The number of times that each column of values occurs.
+    :param percentiles: A sequence of percentiles to compute, between 0 and 100.
+    :rtype : A numpy array with shape (len(percentiles), values.shape[0]).
+    """
+    ntotal = counts.sum()
+    if 4 * counts.size > ntotal:
+        # sorting the unique values is slower than partitioning the expanded array unless most of the values are
+        # repeats, so just use the standard percentile algorithm
+        return np.percentile(np.repeat(values, counts, axis=1), percentiles, axis=1)
+
+    rows = np.arange(values.shape[0])
+    order = np.argsort(values, axis=1)
+    sorted_values = values[rows[:, np.newaxis], order]
+    # cumulative number of values in the expanded array, for each row
+    cumcounts = np.cumsum(counts[order], axis=1)
+
+    result = np.empty((len(percentiles), values.shape[0]))
+    for i, percentile in enumerate(percentiles):
+        # linearly interpolate between the closest ranks, as done by np.percentile
+        rank = (ntotal - 1) * percentile / 100.0
+        rank_low = np.floor(rank)
+        rank_high = min(rank_low + 1, ntotal - 1)
+        value_low = sorted_values[rows, (cumcounts <= rank_low).sum(axis=1)]
+        value_high = sorted_values[rows, (cumcounts <= rank_high).sum(axis=1)]
+        result[i] = value_low + (rank - rank_low) * (value_high - value_low)
+
+    return result
+
+
 def arrayToVec(array, arrType=carmcmcLib.vecD):
     """
     Convert the input numpy array to a python wrapper of a C++ std::vector<double> object.
@@ -907,9 +940,9 @@ class Car1Sample(CarmaSample):
         names = ['sigma', 'measerr_scale', 'mu', 'log_omega']
         if names != self._samples.keys():
             self._samples['var'] = trace[:, 0] ** 2
-            self._samples['measerr_scale'] = trace[:, 1]
-            self._samples['mu'] = trace[:, 2]
-            self._samples['log_omega'] = trace[:, 3]
+            self._samples['measerr_scale'] = np.ascontiguousarray(trace[:, 1])
+            self._samples['mu'] = np.ascontiguousarray(trace[:, 2])
+            self._samples['log_omega'] = np.ascontiguousarray(trace[:, 3])
 
     def _ar_roots(self):
         print "_ar_roots not supported for CAR1"
@@ -979,8 +1012,9 @@ class Car1Sample(CarmaSample):
 
             nsamples0 = sigmas.shape[0]
             index = np.arange(nsamples) * (nsamples0 / nsamples)
-            sigmas = sigmas[index]
-            log_omegas = log_omegas[index]
+            # np.take copies the thinned samples into contiguous arrays for the PSD calculation below
+            sigmas = np.take(sigmas, index, axis=0)
+            log_omegas = np.take(log_omegas, index, axis=0)
 
         nfreq = 1000
         dt_min = self.time[1:] - self.time[0:self.time.size - 1]
@@ -999,16 +1033,14 @@ class Car1Sample(CarmaSample):
         lower = (100.0 - percentile) / 2.0  # lower and upper intervals for credible region
         upper = 100.0 - lower
 
-        numer = sigmas ** 2
-        omegasq = np.exp(log_omegas) ** 2
-        for i in xrange(nfreq):
-            denom = omegasq + (2. * np.pi * frequencies[i]) ** 2
-            psd_samples = numer / denom
+        # Compute the PSDs from the MCMC samples on a (nfreq, nsamples) grid
+        numer = sigmas.ravel() ** 2
+        omegasq = np.exp(log_omegas.ravel()) ** 2
+        denom = omegasq + (2. * np.pi * frequencies[:, np.newaxis]) ** 2
+        psd_samples = numer / denom
 
-            # Now compute credibility interval for power spectrum
-            psd_credint[i, 0] = np.percentile(psd_samples, lower, axis=0)
-            psd_credint[i, 2] = np.percentile(psd_samples, upper, axis=0)
-            psd_credint[i, 1] = np.median(psd_samples, axis=0)
+        # Now compute credibility interval for power spectrum, getting all three percentiles in one pass
+        psd_credint[:] = np.percentile(psd_samples, [lower, 50.0, upper], axis=1).T
 
         # Plot the power spectra
         if sp == None:
@@ -1075,10 +1107,29 @@ def power_spectrum(freq, sigma, ar_coef, ma_coefs=[1.0]):
     except ValueError:
         "Size of ma_coefs must be less or equal to size of ar_roots."
 
-    ma_poly = np.polyval(ma_coefs[::-1], 2.0 * np.pi * 1j * freq)  # Evaluate the polynomial in the PSD numerator
-    ar_poly = np.polyval(ar_coef, 2.0 * np.pi * 1j * freq)  # Evaluate the polynomial in the PSD denominator
-    pspec = sigma ** 2 * np.abs(ma_poly) ** 2 / np.abs(ar_poly) ** 2
-    return pspec
+    omega = 2.0 * np.pi * np.asarray(freq, dtype=float)
+    ma_abs2 = _poly_abs2_imag(ma_coefs[::-1], omega)  # Evaluate the polynomial in the PSD numerator
+    ar_abs2 = _poly_abs2_imag(ar_coef, omega)  # Evaluate the polynomial in the PSD denominator
+    pspec = sigma ** 2 * ma_abs2 / ar_abs2
+    return pspec[()]  # return a scalar instead of a 0-d array for a scalar frequency
+
+
+def _poly_abs2_imag(coefs, omega):
+    """
+    Return the squared modulus of a polynomial with real coefficients evaluated on the imaginary axis, i.e.,
+    |coefs[0] * (i omega)^n + coefs[1] * (i omega)^(n-1) + ... + coefs[n]|^2. Horner's method is used, keeping track of
+    the real and imaginary parts separately so that only real arithmetic is needed.
+
+    :param coefs: The real polynomial coefficients, ordered from the highest power to the constant term.
+    :param omega: The angular frequencies, a scalar or numpy array.
+    """
+    poly_real = np.zeros(np.shape(omega)) + coefs[0]
+    poly_imag = np.zeros(np.shape(omega))
+    for coef in coefs[1:]:
+        # multiply by i * omega and add the next coefficient
+        poly_real, poly_imag = coef - omega * poly_imag, omega * poly_real
+
+    return poly_real ** 2 + poly_imag ** 2
 
 
 def carma_variance(sigsqr, ar_roots, ma_coefs=[1.0], lag=0.0):
@@ -1100,25 +1151,22 @@ def carma_variance(sigsqr, ar_roots, ma_coefs=[1.0], lag=0.0):
         nmore = len(ar_roots) - len(ma_coefs)
         ma_coefs = np.append(ma_coefs, np.zeros(nmore))
 
-    sigma1_variance = 0.0 + 0j
     p = ar_roots.size
-    for k in xrange(p):
-        denom_product = 1.0 + 0j
-        for l in xrange(p):
-            if l != k:
-                denom_product *= (ar_roots[l] - ar_roots[k]) * (np.conjugate(ar_roots[l]) + ar_roots[k])
-
-        denom = -2.0 * denom_product * ar_roots[k].real
-
-        ma_sum1 = 0.0 + 0j
-        ma_sum2 = 0.0 + 0j
-        for l in xrange(p):
-            ma_sum1 += ma_coefs[l] * ar_roots[k] ** l
-            ma_sum2 += ma_coefs[l] * (-1.0 * ar_roots[k]) ** l
-
-        numer = ma_sum1 * ma_sum2 * np.exp(ar_roots[k] * abs(lag))
-
-        sigma1_variance += numer / denom
+    # element [k, l] of these arrays contains the term for roots k and l in the product in the denominator
+    roots_diff = ar_roots[np.newaxis, :] - ar_roots[:, np.newaxis]
+    roots_sum = np.conjugate(ar_roots)[np.newaxis, :] + ar_roots[:, np.newaxis]
+    # the product is only over l != k, so set the diagonal terms to unity
+    np.fill_diagonal(roots_diff, 1.0)
+    np.fill_diagonal(roots_sum, 1.0)
+    denom = -2.0 * ar_roots.real * (roots_diff * roots_sum).prod(axis=1)
+
+    # evaluate the MA polynomial at each of the roots and their negatives
+    powers = np.arange(p)
+    ma_sum1 = (ar_roots[:, np.newaxis] ** powers).dot(ma_coefs)
+    ma_sum2 = ((-1.0 * ar_roots[:, np.newaxis]) ** powers).dot(ma_coefs)
+
+    # sum the terms for each root along the last axis, so that lag may also be an array
+    sigma1_variance = np.exp(np.multiply.outer(np.abs(lag), ar_roots)).dot(ma_sum1 * ma_sum2 / denom)
 
     return sigsqr * sigma1_variance.real
 
@@ -1135,16 +1183,56 @@ def car1_process(time, sigsqr, tau):
 
     marginal_var = sigsqr * tau / 2.0
     y = np.zeros(len(time))
-    y[0] = np.sqrt(marginal_var) * np.random.standard_normal()
+    snorm = np.random.standard_normal(len(time))
+    y[0] = np.sqrt(marginal_var) * snorm[0]
 
     for i in range(1, len(time)):
         dt = time[i] - time[i-1]
         rho = np.exp(-dt / tau)
         conditional_var = marginal_var * (1.0 - rho ** 2)
-        y[i] = rho * y[i-1] + np.sqrt(conditional_var) * np.random.standard_normal()
+        y[i] = rho * y[i-1] + np.sqrt(conditional_var) * snorm[i]
 
     return y
 
+def _rotated_input_vector(ar_roots):
+    """
+    Return the input vector of the CARMA(p,q) state space representation in the rotated state basis, J = inv(E) * R.
+    Here E is the Vandermonde matrix of eigenvectors, E[k, :] = ar_roots ** k, and the input vector under the original
+    state space representation is R = (0, ..., 0, 1). This has the closed form
+    J[k] = 1 / prod_{l != k} (ar_roots[k] - ar_roots[l]), so no linear system needs to be solved.
+
+    :param ar_roots: The roots of the autoregressive characteristic polynomial.
+    """
+    roots_diff = ar_roots[:, np.newaxis] - ar_roots[np.newaxis, :]
+    np.fill_diagonal(roots_diff, 1.0)
+
+    return 1.0 / roots_diff.prod(axis=1)
+
+
+def _transition_cache(time, ar_roots, max_products=100):
+    """
+    Compute the Kalman filter state transitions, exp(ar_roots * dt), once for each unique time step between the input
+    time values. The outer products of the state transitions with their conjugates take p^2 memory for each time step,
+    so they are only cached when there are at most max_products unique time steps, e.g., for regularly sampled time
+    series.
+
+    :param time: The sorted time values.
+    :param ar_roots: The roots of the autoregressive characteristic polynomial.
+    :param max_products: The maximum number of unique time steps for which to cache the outer products.
+    :rtype : A tuple of (dt_index, transitions, products). The state transition from time[i] to time[i + 1] is
+        transitions[dt_index[i]], and the outer product is products[dt_index[i]]. If the outer products are not cached
+        then products is None.
+    """
+    dt_unique, dt_index = np.unique(time[1:] - time[:-1], return_inverse=True)
+    transitions = np.exp(np.outer(dt_unique, ar_roots))
+    if dt_unique.size <= max_products:
+        products = transitions[:, :, np.newaxis] * np.conjugate(transitions[:, np.newaxis, :])
+    else:
+        products = None
+
+    return dt_index, transitions, products
+
+
 def carma_process(time, sigsqr, ar_roots, ma_coefs=[1.0]):
     """
     Generate a CARMA(p,q) process.
@@ -1192,67 +1280,85 @@ def carma_process(time, sigsqr, ar_roots, ma_coefs=[1.0]):
 
     # Setup the matrix of Eigenvectors for the Kalman Filter transition matrix. This allows us to transform
     # quantities into the rotated state basis, which makes the computations for the Kalman filter easier and faster.
+    # EigenMat[k, :] = ar_roots ** k, with the powers built up by a cumulative product over the rows.
     EigenMat = np.ones((p, p), dtype=complex)
-    EigenMat[1, :] = ar_roots
-    for k in xrange(2, p):
-        EigenMat[k, :] = ar_roots ** k
-
-    # Input vector under the original state space representation
-    Rvector = np.zeros(p, dtype=complex)
-    Rvector[-1] = 1.0
+    EigenMat[1:, :] = np.cumprod(np.tile(ar_roots, (p - 1, 1)), axis=0)
 
     # Input vector under rotated state space representation
-    Jvector = solve(EigenMat, Rvector)  # J = inv(E) * R
+    Jvector = _rotated_input_vector(ar_roots)  # J = inv(E) * R
 
     # Compute the vector of moving average coefficients in the rotated state.
     rotated_MA_coefs = ma_coefs.dot(EigenMat)
 
     # Calculate the stationary covariance matrix of the state vector
-    StateVar = np.empty((p, p), dtype=complex)
-    for j in xrange(p):
-        StateVar[:, j] = -sigsqr * Jvector * np.conjugate(Jvector[j]) / (ar_roots + np.conjugate(ar_roots[j]))
+    StateVar = -sigsqr * np.outer(Jvector, np.conjugate(Jvector)) / \
+        (ar_roots[:, np.newaxis] + np.conjugate(ar_roots)[np.newaxis, :])
 
     # Initialize variance in one-step prediction error and the state vector
     PredictionVar = StateVar.copy()
     StateVector = np.zeros(p, dtype=complex)
 
-    # Convert the current state to matrices for convenience, since we'll be doing some Linear algebra.
-    StateVector = np.matrix(StateVector).T
-    StateVar = np.matrix(StateVar)
-    PredictionVar = np.matrix(PredictionVar)
-    rotated_MA_coefs = np.matrix(rotated_MA_coefs)  # this is a row vector, so no transpose
-    StateTransition = np.zeros_like(StateVector)
-    KalmanGain = np.zeros_like(StateVector)
+    # The state quantities are kept as plain arrays: the state vector and Kalman gain are 1-d vectors of length p, and
+    # the covariance matrices are p x p. The conjugate of the rotated MA coefficients is needed for the quadratic forms.
+    rotated_MA_conj = np.conjugate(rotated_MA_coefs)
 
     # Initialize the Kalman mean and variance. These are the forecasted values and their variances.
+    # StateObsCovar = PredictionVar * conj(rotated_MA_coefs) is the covariance between the predicted state and the
+    # predicted observation. It is needed for both the observation variance and the next Kalman gain.
     kalman_mean = 0.0
-    kalman_var = np.real(np.asscalar(rotated_MA_coefs * PredictionVar * rotated_MA_coefs.H))
+    StateObsCovar = PredictionVar.dot(rotated_MA_conj)
+    kalman_var = np.real(rotated_MA_coefs.dot(StateObsCovar))
+
+    # draw all of the standard normal deviates needed for the simulation at once, instead of one per time step
+    snorm = np.random.standard_normal(time.size)
 
     # simulate the first time series value
-    y = np.empty_like(time)
-    y[0] = np.random.normal(kalman_mean, np.sqrt(kalman_var))
+    y = np.empty(time.size, dtype=float)
+    y[0] = kalman_mean + np.sqrt(kalman_var) * snorm[0]
 
     # Initialize the innovations, i.e., the KF residuals
     innovation = y[0]
 
+    # The state transition only depends on the time step, so look it up from the values computed for each unique time
+    # step. The outer products used to propagate the state covariance matrix are only cached when there are few unique
+    # time steps, otherwise they are computed for each step.
+    dt_index, StateTransitions, TransitionProducts = _transition_cache(time, ar_roots)
+
+    # Scratch arrays for the time loop. These are allocated once and then updated in place.
+    KalmanGain = np.empty(p, dtype=complex)
+    KalmanGainConj = np.empty(p, dtype=complex)
+    GainOuter = np.empty((p, p), dtype=complex)
+    TransitionConj = np.empty(p, dtype=complex)
+    TransitionProduct = np.empty((p, p), dtype=complex)
+
     for i in xrange(1, time.size):
         # First compute the Kalman gain
-        KalmanGain = PredictionVar * rotated_MA_coefs.H / kalman_var
+        np.divide(StateObsCovar, kalman_var, out=KalmanGain)
         # update the state vector
         StateVector += innovation * KalmanGain
-        # update the state one-step prediction error variance
-        PredictionVar -= kalman_var * (KalmanGain * KalmanGain.H)
+        # update the state one-step prediction error variance, a rank-1 update
+        np.conjugate(KalmanGain, out=KalmanGainConj)
+        np.multiply(KalmanGain[:, np.newaxis], KalmanGainConj, out=GainOuter)
+        GainOuter *= kalman_var
+        PredictionVar -= GainOuter
         # predict the next state, do element-wise multiplication
-        dt = time[i] - time[i - 1]
-        StateTransition = np.matrix(np.exp(ar_roots * dt)).T
-        StateVector = np.multiply(StateVector, StateTransition)
+        StateTransition = StateTransitions[dt_index[i - 1]]
+        StateVector *= StateTransition
         # update the predicted state covariance matrix
-        PredictionVar = np.multiply(StateTransition * StateTransition.H, PredictionVar - StateVar) + StateVar
+        if TransitionProducts is None:
+            np.conjugate(StateTransition, out=TransitionConj)
+            np.multiply(StateTransition[:, np.newaxis], TransitionConj, out=TransitionProduct)
+        else:
+            TransitionProduct = TransitionProducts[dt_index[i - 1]]
+        PredictionVar -= StateVar
+        PredictionVar *= TransitionProduct
+        PredictionVar += StateVar
         # now predict the observation and its variance
-        kalman_mean = np.real(np.asscalar(rotated_MA_coefs * StateVector))
-        kalman_var = np.real(np.asscalar(rotated_MA_coefs * PredictionVar * rotated_MA_coefs.H))
+        kalman_mean = np.real(rotated_MA_coefs.dot(StateVector))
+        np.dot(PredictionVar, rotated_MA_conj, out=StateObsCovar)
+        kalman_var = np.real(rotated_MA_coefs.dot(StateObsCovar))
         # simulate the next time series value
-        y[i] = np.random.normal(kalman_mean, np.sqrt(kalman_var))
+        y[i] = kalman_mean + np.sqrt(kalman_var) * snorm[i]
         # finally, update the innovation
         innovation = y[i] - kalman_mean
 
@@ -1292,44 +1398,45 @@ class KalmanFilterDeprecated(object):
         """
         # Setup the matrix of Eigenvectors for the Kalman Filter transition matrix. This allows us to transform
         # quantities into the rotated state basis, which makes the computations for the Kalman filter easier and faster.
+        # EigenMat[k, :] = ar_roots ** k, with the powers built up by a cumulative product over the rows.
         EigenMat = np.ones((self.p, self.p), dtype=complex)
-        EigenMat[1, :] = self.ar_roots
-        for k in xrange(2, self.p):
-            EigenMat[k, :] = self.ar_roots ** k
-
-        # Input vector under the original state space representation
-        Rvector = np.zeros(self.p, dtype=complex)
-        Rvector[-1] = 1.0
+        EigenMat[1:, :] = np.cumprod(np.tile(self.ar_roots, (self.p - 1, 1)), axis=0)
 
         # Input vector under rotated state space representation
-        Jvector = solve(EigenMat, Rvector)  # J = inv(E) * R
+        Jvector = _rotated_input_vector(self.ar_roots)  # J = inv(E) * R
 
         # Compute the vector of moving average coefficients in the rotated state.
         rotated_MA_coefs = self.ma_coefs.dot(EigenMat)
 
         # Calculate the stationary covariance matrix of the state vector
-        StateVar = np.empty((self.p, self.p), dtype=complex)
-        for j in xrange(self.p):
-            StateVar[:, j] = -self.sigsqr * Jvector * np.conjugate(Jvector[j]) / \
-                             (self.ar_roots + np.conjugate(self.ar_roots[j]))
+        StateVar = -self.sigsqr * np.outer(Jvector, np.conjugate(Jvector)) / \
+            (self.ar_roots[:, np.newaxis] + np.conjugate(self.ar_roots)[np.newaxis, :])
 
         # Initialize variance in one-step prediction error and the state vector
         PredictionVar = StateVar.copy()
         StateVector = np.zeros(self.p, dtype=complex)
 
-        # Convert the current state to matrices for convenience, since we'll be doing some Linear algebra.
-        self._StateVector = np.matrix(StateVector).T
-        self._StateVar = np.matrix(StateVar)
-        self._PredictionVar = np.matrix(PredictionVar)
-        self._rotated_MA_coefs = np.matrix(rotated_MA_coefs)  # this is a row vector, so no transpose
+        # The state vector and Kalman gain are 1-d vectors of length p, and the covariance matrices are p x p arrays.
+        # The conjugate of the rotated MA coefficients is needed for the quadratic forms.
+        self._StateVector = StateVector
+        self._StateVar = StateVar
+        self._PredictionVar = PredictionVar
+        self._rotated_MA_coefs = rotated_MA_coefs
+        self._rotated_MA_conj = np.conjugate(rotated_MA_coefs)
         self._StateTransition = np.zeros_like(self._StateVector)
         self._KalmanGain = np.zeros_like(self._StateVector)
+        # Scratch arrays for the time loops in update() and predict(). These are allocated once and then updated in
+        # place.
+        self._KalmanGainConj = np.empty(self.p, dtype=complex)
+        self._GainOuter = np.empty((self.p, self.p), dtype=complex)
+        self._TransitionConj = np.empty(self.p, dtype=complex)
+        self._TransitionProduct = np.empty((self.p, self.p), dtype=complex)
 
         # Initialize the Kalman mean and variance. These are the forecasted values and their variances.
-        self.kalman_mean = np.empty_like(self.time)
-        self.kalman_var = np.empty_like(self.time)
+        self.kalman_mean = np.empty(self.time.size, dtype=float)
+        self.kalman_var = np.empty(self.time.size, dtype=float)
         self.kalman_mean[0] = 0.0
-        self.kalman_var[0] = np.real(self._rotated_MA_coefs * self._PredictionVar * self._rotated_MA_coefs.H) \
+        self.kalman_var[0] = np.real(self._rotated_MA_coefs.dot(self._PredictionVar.dot(self._rotated_MA_conj))) \
                              + self.yvar[0]
 
         # Initialize the innovations, i.e., the KF residuals
@@ -1337,27 +1444,56 @@ class KalmanFilterDeprecated(object):
 
         self._current_index = 1
 
+        # The state transition and the matrix exp((ar_roots[k] + conj(ar_roots[j])) * dt), which factors as the outer
+        # product of exp(ar_roots * dt) with its conjugate, only depend on the time step. Compute the state transitions
+        # once for each unique time step between the measured time values. The outer products are only cached when
+        # there are few unique time steps.
+        self._dt_index, self._StateTransitions, self._TransitionProducts = _transition_cache(self.time, self.ar_roots)
+
+    def _update_prediction_var(self, kalman_var, dt_index):
+        """
+        Update the state one-step prediction error variance in place for the current Kalman gain, and then propagate it
+        forward by the unique time step dt_index.
+
+        :param kalman_var: The variance of the current one-step prediction of the time series.
+        :param dt_index: The index of the time step in the unique time steps.
+        """
+        # the update is a rank-1 correction
+        np.conjugate(self._KalmanGain, out=self._KalmanGainConj)
+        np.multiply(self._KalmanGain[:, np.newaxis], self._KalmanGainConj, out=self._GainOuter)
+        self._GainOuter *= kalman_var
+        self._PredictionVar -= self._GainOuter
+        # the outer products of the state transitions with their conjugates are only cached for few unique time steps
+        if self._TransitionProducts is None:
+            StateTransition = self._StateTransitions[dt_index]
+            np.conjugate(StateTransition, out=self._TransitionConj)
+            np.multiply(StateTransition[:, np.newaxis], self._TransitionConj, out=self._TransitionProduct)
+            TransitionProduct = self._TransitionProduct
+        else:
+            TransitionProduct = self._TransitionProducts[dt_index]
+        self._PredictionVar -= self._StateVar
+        self._PredictionVar *= TransitionProduct
+        self._PredictionVar += self._StateVar
+
     def update(self):
         """
         Perform one iteration (update) of the Kalman Filter.
         """
         # First compute the Kalman gain
-        self._KalmanGain = self._PredictionVar * self._rotated_MA_coefs.H / self.kalman_var[self._current_index - 1]
+        np.dot(self._PredictionVar, self._rotated_MA_conj, out=self._KalmanGain)
+        self._KalmanGain /= self.kalman_var[self._current_index - 1]
         # update the state vector
         self._StateVector += self._innovation * self._KalmanGain
-        # update the state one-step prediction error variance
-        self._PredictionVar -= self.kalman_var[self._current_index - 1] * (self._KalmanGain * self._KalmanGain.H)
         # predict the next state, do element-wise multiplication
-        dt = self.time[self._current_index] - self.time[self._current_index - 1]
-        self._StateTransition = np.matrix(np.exp(self.ar_roots * dt)).T
-        self._StateVector = np.multiply(self._StateVector, self._StateTransition)
-        # update the predicted state covariance matrix
-        self._PredictionVar = np.multiply(self._StateTransition * self._StateTransition.H,
-                                          self._PredictionVar - self._StateVar) + self._StateVar
+        dt_index = self._dt_index[self._current_index - 1]
+        self._StateTransition = self._StateTransitions[dt_index]
+        self._StateVector *= self._StateTransition
+        # update the state one-step prediction error variance, and then the predicted state covariance matrix
+        self._update_prediction_var(self.kalman_var[self._current_index - 1], dt_index)
         # now predict the observation and its variance
-        self.kalman_mean[self._current_index] = np.real(np.asscalar(self._rotated_MA_coefs * self._StateVector))
+        self.kalman_mean[self._current_index] = np.real(self._rotated_MA_coefs.dot(self._StateVector))
         self.kalman_var[self._current_index] = \
-            np.real(np.asscalar(self._rotated_MA_coefs * self._PredictionVar * self._rotated_MA_coefs.H))
+            np.real(self._rotated_MA_coefs.dot(self._PredictionVar.dot(self._rotated_MA_conj)))
         self.kalman_var[self._current_index] += self.yvar[self._current_index]
         # finally, update the innovation
         self._innovation = self.y[self._current_index] - self.kalman_mean[self._current_index]
@@ -1395,17 +1531,18 @@ class KalmanFilterDeprecated(object):
             self.update()
 
         # predict the value of y[time_predict]
-        self._KalmanGain = self._PredictionVar * self._rotated_MA_coefs.H / self.kalman_var[ipredict - 1]
+        self._KalmanGain = self._PredictionVar.dot(self._rotated_MA_conj) / self.kalman_var[ipredict - 1]
         self._StateVector += self._innovation * self._KalmanGain
-        self._PredictionVar -= self.kalman_var[ipredict - 1] * (self._KalmanGain * self._KalmanGain.H)
+        self._PredictionVar -= self.kalman_var[ipredict - 1] * \
+            np.outer(self._KalmanGain, np.conjugate(self._KalmanGain))
         dt = time_predict - self.time[ipredict - 1]
-        self._StateTransition = np.matrix(np.exp(self.ar_roots * dt)).T
-        self._StateVector = np.multiply(self._StateVector, self._StateTransition)
-        self._PredictionVar = np.multiply(self._StateTransition * self._StateTransition.H,
-                                          self._PredictionVar - self._StateVar) + self._StateVar
+        self._StateTransition = np.exp(self.ar_roots * dt)
+        self._StateVector = self._StateVector * self._StateTransition
+        self._PredictionVar = np.outer(self._StateTransition, np.conjugate(self._StateTransition)) * \
+            (self._PredictionVar - self._StateVar) + self._StateVar
 
-        ypredict_mean = np.asscalar(np.real(self._rotated_MA_coefs * self._StateVector))
-        ypredict_var = np.asscalar(np.real(self._rotated_MA_coefs * self._PredictionVar * self._rotated_MA_coefs.H))
+        ypredict_mean = np.real(self._rotated_MA_coefs.dot(self._StateVector))
+        ypredict_var = np.real(self._rotated_MA_coefs.dot(self._PredictionVar.dot(self._rotated_MA_conj)))
 
         # start the running statistics for the conditional mean and precision of the predicted time series value, given
         # the measured time series
@@ -1421,26 +1558,26 @@ class KalmanFilterDeprecated(object):
         # filter.
 
         # first set the initial values.
-        self._KalmanGain = self._PredictionVar * self._rotated_MA_coefs.H / ypredict_var
+        self._KalmanGain = self._PredictionVar.dot(self._rotated_MA_conj) / ypredict_var
         # initialize the coefficients for predicting the state vector at coefs(time_predict|time_predict)
         const_state = self._StateVector - self._KalmanGain * ypredict_mean
         slope_state = self._KalmanGain
         # update the state one-step prediction error variance
-        self._PredictionVar -= ypredict_var * (self._KalmanGain * self._KalmanGain.H)
+        self._PredictionVar -= ypredict_var * np.outer(self._KalmanGain, np.conjugate(self._KalmanGain))
         # do coefs(time_predict|time_predict) --> coefs(time[i+1]|time_predict)
         dt = self.time[ipredict] - time_predict
-        self._StateTransition = np.matrix(np.exp(self.ar_roots * dt)).T
-        const_state = np.multiply(const_state, self._StateTransition)
-        slope_state = np.multiply(slope_state, self._StateTransition)
+        self._StateTransition = np.exp(self.ar_roots * dt)
+        const_state = const_state * self._StateTransition
+        slope_state = slope_state * self._StateTransition
         # update the predicted state covariance matrix
-        self._PredictionVar = np.multiply(self._StateTransition * self._StateTransition.H,
-                                          self._PredictionVar - self._StateVar) + self._StateVar
+        self._PredictionVar = np.outer(self._StateTransition, np.conjugate(self._StateTransition)) * \
+            (self._PredictionVar - self._StateVar) + self._StateVar
         # compute the coefficients for the linear filter at time[ipredict], and compute the variance in the predicted
         # y[ipredict]
-        const = np.asscalar(np.real(self._rotated_MA_coefs * const_state))
-        slope = np.asscalar(np.real(self._rotated_MA_coefs * slope_state))
+        const = np.real(self._rotated_MA_coefs.dot(const_state))
+        slope = np.real(self._rotated_MA_coefs.dot(slope_state))
         self.kalman_var[ipredict] = \
-            np.real(self._rotated_MA_coefs * self._PredictionVar * self._rotated_MA_coefs.H) + \
+            np.real(self._rotated_MA_coefs.dot(self._PredictionVar.dot(self._rotated_MA_conj))) + \
             self.yvar[ipredict]
 
         # update the running conditional mean and variance of the predicted time series value
@@ -1454,26 +1591,24 @@ class KalmanFilterDeprecated(object):
 
         # now repeat for time > time_predict
         for i in xrange(ipredict + 1, self.time.size):
-            self._KalmanGain = self._PredictionVar * self._rotated_MA_coefs.H / self.kalman_var[i - 1]
+            np.dot(self._PredictionVar, self._rotated_MA_conj, out=self._KalmanGain)
+            self._KalmanGain /= self.kalman_var[i - 1]
             # update the state prediction coefficients: coefs(i|i-1) --> coefs(i|i)
             const_state += self._KalmanGain * (self.y[i - 1] - const)
             slope_state -= self._KalmanGain * slope
-            # update the state one-step prediction error variance
-            self._PredictionVar -= self.kalman_var[i - 1] * (self._KalmanGain * self._KalmanGain.H)
             # compute the one-step state prediction coefficients: coefs(i|i) --> coefs(i+1|i)
-            dt = self.time[i] - self.time[i - 1]
-            self._StateTransition = np.matrix(np.exp(self.ar_roots * dt)).T
-            const_state = np.multiply(const_state, self._StateTransition)
-            slope_state = np.multiply(slope_state, self._StateTransition)
-            # compute the state one-step prediction error variance
-            self._PredictionVar = np.multiply(self._StateTransition * self._StateTransition.H,
-                                              self._PredictionVar - self._StateVar) + self._StateVar
+            dt_index = self._dt_index[i - 1]
+            self._StateTransition = self._StateTransitions[dt_index]
+            const_state *= self._StateTransition
+            slope_state *= self._StateTransition
+            # update the state one-step prediction error variance, and then compute it for the next time step
+            self._update_prediction_var(self.kalman_var[i - 1], dt_index)
             # compute the coefficients for predicting y[i]|y[j],j<i as a function of ypredict
-            const = np.asscalar(np.real(self._rotated_MA_coefs * const_state))
-            slope = np.asscalar(np.real(self._rotated_MA_coefs * slope_state))
+            const = np.real(self._rotated_MA_coefs.dot(const_state))
+            slope = np.real(self._rotated_MA_coefs.dot(slope_state))
             # compute the variance in predicting y[i]|y[j],j<i
             self.kalman_var[i] = \
-                np.real(self._rotated_MA_coefs * self._PredictionVar * self._rotated_MA_coefs.H) + \
+                np.real(self._rotated_MA_coefs.dot(self._PredictionVar.dot(self._rotated_MA_conj))) + \
                 self.yvar[i]
             # finally, update the running conditional mean and variance of the predicted time series value
             cprecision += slope ** 2 / self.kalman_var[i]
@@ -1,7 +1,9 @@
 import os
 import unittest
 import numpy as np
+from scipy.linalg import solve
 import carmcmc 
+from carmcmc import carma_pack
 np.random.seed(1)
 
 class TestCarpackOrder(unittest.TestCase):
@@ -224,5 +226,188 @@ class TestCarpackOrder(unittest.TestCase):
             postpqo.assess_fit(nplot=1000, bestfit=bestfit, doShow=False)
             postpqe.assess_fit(nplot=1000, bestfit=bestfit, doShow=False)
         
+class TestCarmaPackHelpers(unittest.TestCase):
+
+    def setUp(self):
+        # CAR(5) roots used above, with a real root so that p is odd
+        self.ar_roots = np.array([-0.06283185-1.25663706j, -0.06283185+1.25663706j,
+                                  -0.02094395-0.25132741j, -0.02094395+0.25132741j,
+                                  -0.03141593+0.j])
+
+    def testRotatedInputVector(self):
+        root_sets = [np.array([-0.5+2.0j, -0.5-2.0j]),  # p = 2
+                     np.array([-0.3, -1.7]),  # p = 2, real roots
+                     np.array([-0.1+0.3j, -0.1-0.3j, -0.7+0.j]),  # odd p with a real root
+                     self.ar_roots]
+        for ar_roots in root_sets:
+            p = ar_roots.size
+            EigenMat = np.vander(ar_roots, p)[:, ::-1].T  # EigenMat[k, :] = ar_roots ** k
+            Rvector = np.zeros(p, dtype=complex)
+            Rvector[-1] = 1.0
+            Jvector = solve(EigenMat, Rvector)
+            np.testing.assert_allclose(carma_pack._rotated_input_vector(ar_roots), Jvector, rtol=1e-10)
+
+    def testUniqueDraws(self):
+        nsamples = 200
+        sigma = np.random.randint(0, 20, nsamples).astype(float)
+        ar_coefs = np.column_stack((np.ones(nsamples), sigma / 2.0, np.zeros(nsamples)))
+        (sigma_unique, ar_unique), counts = carma_pack._unique_draws(sigma, ar_coefs)
+        self.assertEqual(counts.sum(), nsamples)
+        self.assertEqual(len(sigma_unique), len(np.unique(sigma)))
+        self.assertEqual(ar_unique.shape, (len(sigma_unique), 3))
+        for s, c in zip(sigma_unique, counts):
+            self.assertEqual(c, np.sum(sigma == s))
+
+    def testWeightedPercentile(self):
+        nrows = 4
+        percentiles = [0.0, 2.5, 16.0, 50.0, 84.0, 97.5, 100.0]
+        for nunique, ntotal in [(10, 101), (25, 400), (30, 40)]:  # last case uses the np.percentile fallback
+            counts = np.ones(nunique, dtype=int)
+            counts += np.bincount(np.random.randint(0, nunique, ntotal - nunique), minlength=nunique)
+            # use a few integer values so that there are ties between the unique columns
+            values = np.random.randint(0, 5, (nrows, nunique)).astype(float)
+            expanded = np.repeat(values, counts, axis=1)
+            np.testing.assert_allclose(carma_pack._weighted_percentile(values, counts, percentiles),
+                                       np.percentile(expanded, percentiles, axis=1))
+            values = np.random.standard_normal((nrows, nunique))
+            expanded = np.repeat(values, counts, axis=1)
+            np.testing.assert_allclose(carma_pack._weighted_percentile(values, counts, percentiles),
+                                       np.percentile(expanded, percentiles, axis=1))
+
+    def testCarmaVariance(self):
+        ma_coefs = np.array([1.0, 4.5, 1.25])
+        lags = np.array([0.0, 0.5, 3.0, 40.0])
+        acvf = carmcmc.carma_variance(2.0, self.ar_roots, ma_coefs, lag=lags)
+        self.assertEqual(acvf.shape, lags.shape)
+        for lag, acvf_lag in zip(lags, acvf):
+            self.assertAlmostEqual(carmcmc.carma_variance(2.0, self.ar_roots, ma_coefs, lag=lag), acvf_lag)
+            self.assertAlmostEqual(carmcmc.carma_variance(2.0, self.ar_roots, ma_coefs, lag=-lag), acvf_lag)
+        # the variance of a CAR(1) process is sigma^2 * tau / 2
+        tau = 10.0
+        self.assertAlmostEqual(carmcmc.carma_variance(2.0, np.array([-1.0 / tau + 0j])), tau)
+
+    def testPowerSpectrum(self):
+        freq = np.logspace(-4, 1, 50)
+        omega = 2.0 * np.pi * freq
+        ar_coefs = np.poly(self.ar_roots).real
+        ma_coefs = np.array([1.0, 4.5, 1.25])
+        for coefs in [ar_coefs, ma_coefs[::-1], np.array([3.0])]:
+            np.testing.assert_allclose(carma_pack._poly_abs2_imag(coefs, omega),
+                                       np.abs(np.polyval(coefs, 1j * omega)) ** 2)
+
+        psd = carmcmc.power_spectrum(freq, 2.0, ar_coefs, ma_coefs=ma_coefs)
+        psd0 = 4.0 * np.abs(np.polyval(ma_coefs[::-1], 1j * omega)) ** 2 / np.abs(np.polyval(ar_coefs, 1j * omega)) ** 2
+        np.testing.assert_allclose(psd, psd0)
+        # default list input for the MA coefficients
+        psd = carmcmc.power_spectrum(freq, 2.0, ar_coefs)
+        np.testing.assert_allclose(psd, 4.0 / np.abs(np.polyval(ar_coefs, 1j * omega)) ** 2)
+        # scalar frequency
+        psd = carmcmc.power_spectrum(freq[10], 2.0, ar_coefs, ma_coefs=ma_coefs)
+        self.assertEqual(np.ndim(psd), 0)
+        self.assertAlmostEqual(psd / psd0[10], 1.0)
+
+    def testRootsFromQuadCoefs(self):
+        for order in [1, 2, 3, 4, 5]:
+            # mix of quadratic terms with real and complex roots
+            quad_coefs = np.exp(np.random.uniform(-3.0, 3.0, (20, order)))
+            roots = carma_pack._roots_from_quad_coefs(quad_coefs)
+            self.assertEqual(roots.shape, quad_coefs.shape)
+            for i in xrange(quad_coefs.shape[0]):
+                roots0 = []
+                for j in xrange(order / 2):
+                    roots0.extend(np.roots([1.0, quad_coefs[i, 2 * j + 1], quad_coefs[i, 2 * j]]))
+                if order % 2 == 1:
+                    roots0.append(-quad_coefs[i, -1])
+                np.testing.assert_allclose(np.sort_complex(roots[i]), np.sort_complex(roots0))
+
+    def testPolyFromRoots(self):
+        roots = np.vstack((self.ar_roots, np.random.standard_normal(5) + 1j * np.random.standard_normal(5),
+                           np.random.standard_normal(5)))
+        coefs = carma_pack._poly_from_roots(roots)
+        self.assertEqual(coefs.shape, (3, 6))
+        for i in xrange(roots.shape[0]):
+            np.testing.assert_allclose(coefs[i], np.poly(roots[i]))
+        np.testing.assert_allclose(carma_pack._poly_from_roots(roots[:, :1]), np.column_stack((np.ones(3), -roots[:, 0])))
+
+    def testSigmaNoise(self):
+        nsamples = 10
+        for p, q in [(1, 0), (4, 2), (5, 4)]:
+            ar_roots = -np.random.uniform(0.01, 1.0, (nsamples, p)) + 0j
+            npairs = p / 2
+            ar_roots[:, 1:2 * npairs:2] += 1j * np.random.uniform(0.1, 5.0, (nsamples, npairs))
+            ar_roots[:, 0:2 * npairs:2] = np.conjugate(ar_roots[:, 1:2 * npairs:2])
+            ma_coefs = np.column_stack((np.ones(nsamples), np.random.uniform(0.0, 2.0, (nsamples, q))))
+            var = np.random.uniform(0.5, 2.0, nsamples)
+            # only set the attributes that _sigma_noise uses, since building a full sample requires running the sampler
+            sample = carma_pack.CarmaSample.__new__(carma_pack.CarmaSample)
+            sample.p = p
+            sample._samples = {'var': var, 'ar_roots': ar_roots, 'ma_coefs': ma_coefs}
+            sample._sigma_noise()
+            for i in xrange(nsamples):
+                sigma1_variance = carmcmc.carma_variance(1.0, ar_roots[i], ma_coefs[i])
+                self.assertAlmostEqual(var[i] / sample._samples['sigma'][i] ** 2 / sigma1_variance, 1.0)
+
+    def testCarmaProcess(self):
+        # regression test against values simulated by the original np.matrix implementation of carma_process
+        ar_roots = np.array([-0.5+2.0j, -0.5-2.0j, -0.1+0.3j, -0.1-0.3j])
+        ma_coefs = [1.0, 2.0]
+
+        # regular time sampling, so the transition products are cached for the single unique time step
+        y0 = np.array([3.6640840117422004, 3.6293819533357734, 3.083974667514012, 0.6372971500924363,
+                       -0.7329184608883963, -1.3277675174768686, -2.1406499086672532, -3.000563564235697,
+                       -3.077803073562932, -3.1392744340152583])
+        time = np.arange(10.0)
+        self.assertTrue(carma_pack._transition_cache(time, ar_roots)[2] is not None)
+        np.random.seed(3)
+        y = carmcmc.carma_process(time, 2.0, ar_roots, ma_coefs=ma_coefs)
+        np.testing.assert_allclose(y, y0, rtol=1e-10)
+        # integer time values should still give a float time series
+        np.random.seed(3)
+        y = carmcmc.carma_process(np.arange(10), 2.0, ar_roots, ma_coefs=ma_coefs)
+        self.assertTrue(np.issubdtype(y.dtype, np.floating))
+        np.testing.assert_allclose(y, y0, rtol=1e-10)
+
+        # irregular time sampling with more than 100 unique time steps, so the transition products are not cached
+        y0 = np.array([0.10357787852584674, 0.7969793700942256, -0.3577614008018475, 1.775983639723633,
+                       5.079140497773769, 0.0389693401747799, 0.31093371774843603, -0.4131675050084067,
+                       0.8446452019984628, -0.32564517967771883])
+        time = np.sort(np.random.RandomState(2).uniform(0.0, 3000.0, 150))
+        self.assertTrue(carma_pack._transition_cache(time, ar_roots)[2] is None)
+        np.random.seed(4)
+        y = carmcmc.carma_process(time, 2.0, ar_roots, ma_coefs=ma_coefs)
+        self.assertEqual(y.shape, time.shape)
+        np.testing.assert_allclose(y[::15], y0, rtol=1e-8)
+
+    def testKalmanFilterDeprecated(self):
+        # regression test against values computed by the original np.matrix implementation of KalmanFilterDeprecated
+        ar_roots = np.array([-0.5+2.0j, -0.5-2.0j, -0.1+0.3j, -0.1-0.3j])
+        ma_coefs = [1.0, 2.0]
+        # regular time sampling, so the transition products are cached
+        time_reg = np.arange(20.0)
+        kmean_reg = [0.0, -0.6904574557794365, -1.0809629603760902, -0.5250693879867047, 0.44958618103381515]
+        kvar_reg = [4.296532254835224, 1.042595753322788, 1.0258470449986117, 1.0254767325559495, 1.025472059185528]
+        predict_reg = [(1.357590443731733, 0.08225605622287596), (0.47749847494735015, 1.9548402241601621)]
+        # irregular time sampling with more than 100 unique time steps, so the transition products are not cached
+        time_irr = np.sort(np.random.RandomState(5).uniform(0.0, 300.0, 150))
+        kmean_irr = [0.0, 0.1671140945753148, 0.05624004632933144, -0.03536032380481627, 0.47439549637215683,
+                     -0.04897566436921286, -0.4217993608651406, -2.1663050662384027, -0.6357100059216162,
+                     0.25074816958743185]
+        kvar_irr = [4.296532254835224, 0.20640704940416948, 0.4837967869560914, 2.7109912179392515, 2.5498266293205023,
+                    1.4940234755162556, 3.6428215249808953, 0.7825157863254265, 0.5301096898137418, 0.3453808790650491]
+        predict_irr = [(0.8570991563327242, 0.12667029746848177), (-0.39400272522022184, 1.960063468772154)]
+
+        for time, kmean0, kvar0, predict0, step in [(time_reg, kmean_reg, kvar_reg, predict_reg, 4),
+                                                     (time_irr, kmean_irr, kvar_irr, predict_irr, 15)]:
+            y = np.random.RandomState(6).standard_normal(time.size)
+            yvar = 0.1 * np.ones(time.size)
+            kfilter = carma_pack.KalmanFilterDeprecated(time, y, yvar, 2.0, ar_roots, ma_coefs)
+            kmean, kvar = kfilter.filter()
+            np.testing.assert_allclose(kmean[::step], kmean0, rtol=1e-10, atol=1e-12)
+            np.testing.assert_allclose(kvar[::step], kvar0, rtol=1e-10)
+            # interpolation, and then extrapolation past the last time value
+            np.testing.assert_allclose(kfilter.predict(time[5] + 0.3), predict0[0], rtol=1e-10)
+            np.testing.assert_allclose(kfilter.predict(time[-1] + 2.0), predict0[1], rtol=1e-10)
+
+
 if __name__ == "__main__":
     unittest.main()